@@ -1,41 +1,123 @@
 # app.py — FOmatters / Rate My Captain (Option B: Hero access on homepage)
 
 import os, uuid, hmac, hashlib, secrets, string
+from functools import lru_cache
 from datetime import datetime, timedelta
 from pathlib import Path
 
 from flask import Flask, render_template, request, redirect, url_for, session, flash, make_response
-from sqlalchemy import create_engine, select, Column, Integer, String, DateTime, ForeignKey, and_, or_, func
-from sqlalchemy.orm import Session, declarative_base, relationship
+from flask_caching import Cache
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import create_engine, event, select, insert, update, delete, text, literal, table, column, Column, Integer, Float, String, DateTime, ForeignKey, Index, and_, or_, func, inspect
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import Session, declarative_base, relationship, scoped_session, sessionmaker
 
 # ----------------------------
 # Config (env with safe fallbacks)
 # ----------------------------
 APP_NAME = "FOmatters"
+BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = "app.db"
 SECRET_KEY = os.getenv("SECRET_KEY") or "dev-secret-change-me"
 INVITE_CODE = os.getenv("INVITE_CODE") or "FOmatters"
+INVITE_CODE_BYTES = INVITE_CODE.encode()
 REVIEWER_PEPPER = os.getenv("REVIEWER_PEPPER") or "dev-pepper-change-me"
+REVIEWER_PEPPER_BYTES = REVIEWER_PEPPER.encode()
 MIN_DISPLAY_REVIEWS = 3
 
 SUGGESTION_WINDOW_DAYS = 14
 CONSENSUS_THRESHOLD = 2
 
-# Updated bases
-ALLOWED_BASES = ["ORD","IAH","DEN","EWR","IAD","DCA","SFO","LAX","CLE","LGA","GUM","LAS","MCO"]
-ALLOWED_FLEETS = ["737","757","767","777","787","A319","A320","A321"]
+# Updated bases (UI tuples keep dropdown order; sets are for validation)
+ALLOWED_BASES_UI = ("ORD","IAH","DEN","EWR","IAD","DCA","SFO","LAX","CLE","LGA","GUM","LAS","MCO")
+ALLOWED_FLEETS_UI = ("737","757","767","777","787","A319","A320","A321")
+ALLOWED_BASES = frozenset(ALLOWED_BASES_UI)
+ALLOWED_FLEETS = frozenset(ALLOWED_FLEETS_UI)
 
 # ----------------------------
 # Flask
 # ----------------------------
 app = Flask(__name__)
 app.config["SECRET_KEY"] = SECRET_KEY
+app.config["CACHE_TYPE"] = os.getenv("CACHE_TYPE") or "SimpleCache"
+app.config["CACHE_REDIS_URL"] = os.getenv("REDIS_URL")
+cache = Cache(app)
+
+# Static files are fingerprinted (?v=<content hash>), so browsers may keep them for a year
+STATIC_MAX_AGE = 60*60*24*365
+
+@lru_cache(maxsize=None)
+def static_version(filename: str) -> str | None:
+    try:
+        data = (Path(app.static_folder) / filename).read_bytes()
+    except FileNotFoundError:
+        return None  # bad link renders as a plain 404 URL, not a 500 page
+    return hashlib.md5(data, usedforsecurity=False).hexdigest()[:8]
+
+@app.url_defaults
+def _fingerprint_static(endpoint, values):
+    if endpoint == "static" and "filename" in values:
+        version = static_version(values["filename"])
+        if version: values["v"] = version
+
+@app.after_request
+def _static_cache_headers(resp):
+    # Only a found file at a fingerprinted URL is safe to pin; misses and bare
+    # URLs keep Flask's revalidating default
+    if request.endpoint == "static" and resp.status_code == 200 and "v" in request.args:
+        resp.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+    return resp
+
+# Templates only change on deploy: no reload checks, bytecode cached on disk.
+# The cache dir is created and filled by `flask init` (see warm_templates).
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+app.jinja_env.auto_reload = False
+JINJA_CACHE_DIR = BASE_DIR / ".jinja_cache"
+if JINJA_CACHE_DIR.is_dir():
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(JINJA_CACHE_DIR))
+
+def warm_templates():
+    JINJA_CACHE_DIR.mkdir(exist_ok=True)
+    if app.jinja_env.bytecode_cache is None:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(JINJA_CACHE_DIR))
+    for t in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(t)
 
 # ----------------------------
 # DB (SQLite / SQLAlchemy)
 # ----------------------------
 Base = declarative_base()
-engine = create_engine(f"sqlite:///{DB_PATH}", future=True)
+# Pooled connections are reused across requests in each worker (local file, so no
+# pre-ping); writers from other workers wait on the lock instead of erroring out
+engine = create_engine(
+    f"sqlite:///{DB_PATH}", future=True,
+    poolclass=QueuePool, pool_size=5, max_overflow=10,
+    connect_args={"check_same_thread": False, "timeout": 30},
+)
+
+@event.listens_for(engine, "connect")
+def _sqlite_on_connect(dbapi_conn, _record):
+    # WAL: readers don't block on the writer; NORMAL sync is durable enough under
+    # WAL and skips an fsync per commit; bigger page cache + mmap for reads
+    cur = dbapi_conn.cursor()
+    for pragma in (
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        "temp_store=MEMORY",
+        "cache_size=-65536",      # 64 MiB
+        "mmap_size=268435456",    # 256 MiB
+        "foreign_keys=ON",
+    ):
+        cur.execute(f"PRAGMA {pragma}")
+    cur.close()
+
+# One session per request, released on app context teardown
+SessionLocal = scoped_session(sessionmaker(bind=engine, future=True))
+
+@app.teardown_appcontext
+def _remove_session(_exc=None):
+    SessionLocal.remove()
 
 class Captain(Base):
     __tablename__ = "captains"
@@ -45,7 +127,10 @@ class Captain(Base):
     base = Column(String, nullable=False)
     fleet = Column(String, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow)
-    reviews = relationship("Review", back_populates="captain")
+    reviews = relationship("Review", back_populates="captain", lazy="raise")  # aggregate in SQL instead
+
+    # Serves the case-insensitive duplicate-name check in captain_new
+    __table_args__ = (Index("ix_captain_lname", func.lower(name)),)
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -75,7 +160,11 @@ class Review(Base):
     mentorship = Column(Integer, nullable=False)
     humor_vibe = Column(Integer, nullable=False)
 
-    captain = relationship("Captain", back_populates="reviews")
+    captain = relationship("Captain", back_populates="reviews", lazy="raise")
+
+    # Leading captain_id also serves plain per-captain lookups; the full key
+    # backs the 24h duplicate-review probe in review_new
+    __table_args__ = (Index("ix_reviews_captain_hash_time", "captain_id", "reviewer_hash", "created_at"),)
 
 class CaptainAssignment(Base):
     __tablename__ = "captain_assignments"
@@ -87,6 +176,8 @@ class CaptainAssignment(Base):
     end_date = Column(DateTime, nullable=True)
     changed_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index("ix_assign_cap_open", "captain_id", "end_date"),)
+
 class EditSuggestion(Base):
     __tablename__ = "edit_suggestions"
     id = Column(Integer, primary_key=True)
@@ -98,16 +189,133 @@ class EditSuggestion(Base):
     resolved_at = Column(DateTime, nullable=True)
     creator_hash = Column(String, nullable=False)
 
+    __table_args__ = (
+        Index("ix_suggestions_cap_status_time", "captain_id", "status", "created_at"),
+        Index("ix_edit_sug_match", "captain_id", "new_base", "new_fleet", "status", "created_at"),
+    )
+
+class CaptainStats(Base):
+    # Running review totals per captain; bumped on every review insert so pages
+    # divide instead of scanning reviews. Rebuild with rebuild_captain_stats().
+    __tablename__ = "captain_stats"
+    captain_id = Column(Integer, ForeignKey("captains.id"), primary_key=True)
+    review_count = Column(Integer, nullable=False, default=0)
+
+    sum_crm_inclusion = Column(Integer, nullable=False, default=0)
+    sum_communication = Column(Integer, nullable=False, default=0)
+    sum_easy_to_fly = Column(Integer, nullable=False, default=0)
+    sum_micromanage = Column(Integer, nullable=False, default=0)  # raw, inverted on read
+    sum_workload_share = Column(Integer, nullable=False, default=0)
+    sum_helps_box = Column(Integer, nullable=False, default=0)
+    sum_helps_walk = Column(Integer, nullable=False, default=0)
+    sum_skill_sop = Column(Integer, nullable=False, default=0)
+    sum_temperament = Column(Integer, nullable=False, default=0)
+    sum_respectfulness = Column(Integer, nullable=False, default=0)
+    sum_boundaries = Column(Integer, nullable=False, default=0)
+    sum_cabin_respect = Column(Integer, nullable=False, default=0)
+    sum_would_fly_again = Column(Integer, nullable=False, default=0)
+    sum_chattiness = Column(Integer, nullable=False, default=0)
+    sum_mentorship = Column(Integer, nullable=False, default=0)
+    sum_humor_vibe = Column(Integer, nullable=False, default=0)
+    # Denormalized overall score so list/leaderboard reads need no arithmetic
+    avg_overall = Column(Float, nullable=True)
+
+    __table_args__ = (Index("ix_captain_stats_rank", "avg_overall", "review_count"),)
+
+def rebuild_captain_stats(s):
+    """Recompute captain_stats from the reviews table (backfill/repair)."""
+    s.execute(delete(CaptainStats))
+    s.execute(insert(CaptainStats).from_select(
+        ["captain_id", "review_count"] + [f"sum_{k}" for k in ALL_KEYS],
+        select(Captain.id, func.count(Review.id),
+               *[func.coalesce(func.sum(getattr(Review, k)), 0) for k in ALL_KEYS])
+        .outerjoin(Review, Review.captain_id == Captain.id)
+        .group_by(Captain.id)
+    ))
+    s.execute(update(CaptainStats).values(avg_overall=STATS_OVERALL_SQL))
+
+# Trigram FTS5 index over name/base/fleet for substring search on the index page,
+# kept in sync with captains by triggers
+CAPTAINS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS captains_fts USING fts5(
+        name, base, fleet, content='captains', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS captains_fts_ai AFTER INSERT ON captains BEGIN
+        INSERT INTO captains_fts(rowid, name, base, fleet) VALUES (new.id, new.name, new.base, new.fleet);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS captains_fts_ad AFTER DELETE ON captains BEGIN
+        INSERT INTO captains_fts(captains_fts, rowid, name, base, fleet) VALUES ('delete', old.id, old.name, old.base, old.fleet);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS captains_fts_au AFTER UPDATE OF name, base, fleet ON captains BEGIN
+        INSERT INTO captains_fts(captains_fts, rowid, name, base, fleet) VALUES ('delete', old.id, old.name, old.base, old.fleet);
+        INSERT INTO captains_fts(rowid, name, base, fleet) VALUES (new.id, new.name, new.base, new.fleet);
+    END""",
+]
+FTS_MIN_QUERY = 3  # trigram tokenizer can't match shorter strings
+# Query-side handle for the virtual table (created by CAPTAINS_FTS_DDL, not create_all)
+captains_fts = table("captains_fts", column("rowid"), column("rank"), column("captains_fts"))
+
+# Indexes replaced by wider composites above; dropped from existing databases
+SUPERSEDED_INDEXES = ["ix_reviews_captain", "ix_edit_sug_cap_status"]
+
+SEED_CAPTAINS = [("John Smith","ORD","737"), ("Alex Chen","IAH","787"), ("Maria Lopez","DEN","A320")]
+
 def bootstrap_db():
-    Base.metadata.create_all(engine)
+    # Runs in every worker at import; BEGIN IMMEDIATE takes the write lock first so
+    # concurrent workers create/migrate/seed one at a time and then find it done
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        # captain_stats is derived data: if its columns are out of date, drop it and
+        # let the rebuild below refill it
+        insp = inspect(conn)
+        if insp.has_table(CaptainStats.__tablename__):
+            stats_cols = {c["name"] for c in insp.get_columns(CaptainStats.__tablename__)}
+            if stats_cols != set(CaptainStats.__table__.columns.keys()):
+                CaptainStats.__table__.drop(conn)
+        Base.metadata.create_all(conn)
+        # create_all skips indexes on tables that already exist; add any new ones
+        for tbl in Base.metadata.sorted_tables:
+            for idx in tbl.indexes:
+                conn.execute(CreateIndex(idx, if_not_exists=True))
+        for name in SUPERSEDED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        # Backfill the FTS index only when it is first created; from then on the
+        # triggers keep it in sync, so a worker boot doesn't rewrite it under the lock
+        if not insp.has_table("captains_fts"):
+            for ddl in CAPTAINS_FTS_DDL:
+                conn.execute(text(ddl))
+            conn.execute(text("INSERT INTO captains_fts(captains_fts) VALUES ('rebuild')"))
+        captain_count = conn.scalar(select(func.count()).select_from(Captain))
+        if captain_count == 0:
+            # Core executemany inserts: one statement per table, no ORM instances
+            rows = [{"employee_id": f"CA-{secrets.token_hex(4).upper()}", "name": nm, "base": b, "fleet": f}
+                    for nm, b, f in SEED_CAPTAINS]
+            conn.execute(insert(Captain), rows)
+            ids = dict(conn.execute(select(Captain.employee_id, Captain.id).where(
+                Captain.employee_id.in_([r["employee_id"] for r in rows])
+            )).all())
+            conn.execute(insert(CaptainAssignment), [
+                {"captain_id": ids[r["employee_id"]], "base": r["base"], "fleet": r["fleet"]} for r in rows
+            ])
+            conn.execute(insert(CaptainStats), [{"captain_id": i} for i in ids.values()])
+            captain_count = len(rows)
+        if conn.scalar(select(func.count()).select_from(CaptainStats)) != captain_count:
+            rebuild_captain_stats(conn)
+        conn.commit()
+
+@app.cli.command("init")
+def init_command():
+    """Create tables/seed data and bake the template cache (run at build/deploy time)."""
+    bootstrap_db()
+    warm_templates()
+    print("Initialized.")
+
+@app.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    """Recompute captain_stats from all reviews."""
     with Session(engine) as s:
-        if s.query(Captain).count() == 0:
-            for nm, b, f in [("John Smith","ORD","737"), ("Alex Chen","IAH","787"), ("Maria Lopez","DEN","A320")]:
-                c = Captain(employee_id=f"CA-{secrets.token_hex(4).upper()}",
-                            name=nm, base=b, fleet=f)
-                s.add(c); s.flush()
-                s.add(CaptainAssignment(captain_id=c.id, base=b, fleet=f))
-            s.commit()
+        rebuild_captain_stats(s)
+        s.commit()
+    print("Captain stats rebuilt.")
 
 # ----------------------------
 # Rating config & helpers
@@ -138,16 +346,25 @@ STYLE_BLOCK = [
 
 EVAL_KEYS = [k for k,_,_ in EVAL_BLOCK_1 + EVAL_BLOCK_2] + ["would_fly_again"]
 STYLE_KEYS = [k for k,_,_ in STYLE_BLOCK]
-
-def overall_from_review(r) -> float:
-    vals = [
-        r.crm_inclusion, r.communication, r.easy_to_fly,
-        inv(r.micromanage),
-        r.workload_share, r.helps_box, r.helps_walk,
-        r.skill_sop, r.temperament, r.respectfulness, r.boundaries, r.cabin_respect,
-        r.would_fly_again
-    ]
-    return sum(vals)/len(vals)
+ALL_KEYS = EVAL_KEYS + STYLE_KEYS
+RATING_DEFAULTS = dict.fromkeys(ALL_KEYS, 3)
+
+def stats_overall_sql(sums: dict, n):
+    """Overall score from per-key rating totals over n reviews: mean of the 13 eval
+    categories, micromanage inverted. Shared by the rebuild and the per-review update."""
+    total = sum((sums[k] for k in EVAL_KEYS if k != "micromanage"), 6 * n - sums["micromanage"])
+    return total / (13.0 * func.nullif(n, 0))
+
+STATS_OVERALL_SQL = stats_overall_sql(
+    {k: getattr(CaptainStats, f"sum_{k}") for k in EVAL_KEYS}, CaptainStats.review_count
+)
+
+def category_avgs(st) -> dict:
+    """Per-category averages from a CaptainStats row (micromanage inverted)."""
+    n = st.review_count
+    avgs = {k: getattr(st, f"sum_{k}") / n for k in ALL_KEYS}
+    avgs["micromanage"] = inv(avgs["micromanage"])
+    return avgs
 
 # Reviewer token (anonymous)
 REV_COOKIE = "rev_token"
@@ -159,8 +376,13 @@ def get_or_set_reviewer_token():
     new_token = str(uuid.uuid4())
     return new_token, new_token
 
+@lru_cache(maxsize=4096)  # same cookie hits many routes; hash is stable per process
 def reviewer_hash_from_token(token: str) -> str:
-    return hmac.new(REVIEWER_PEPPER.encode(), token.encode(), hashlib.sha256).hexdigest()[:32]
+    return hmac.digest(REVIEWER_PEPPER_BYTES, token.encode(), hashlib.sha256)[:16].hex()
+
+def code_field(src, key: str) -> str:
+    """Base/fleet codes from a form or query string, trimmed and upper-cased."""
+    return (src.get(key) or "").strip().upper()
 
 def new_identifier(prefix="CA"):
     alphabet = string.ascii_uppercase + string.digits
@@ -169,7 +391,49 @@ def new_identifier(prefix="CA"):
 # ----------------------------
 # Routes
 # ----------------------------
+def index_cards(q: str):
+    """(captain row, overall avg or None, review count) per card, plus datalist names."""
+    s = SessionLocal()
+    # Cheap fingerprint: new captains, reviews, or base/fleet updates bust the cache
+    version = tuple(s.execute(select(
+        func.count(Captain.id), func.max(Captain.updated_at),
+        select(func.max(Review.id)).scalar_subquery()
+    )).one())
+    return _index_cards(q, version)
+
+@cache.memoize(30)
+def _index_cards(q: str, version: tuple):
+    s = SessionLocal()
+    # Count + overall average per captain straight from the running totals
+    stmt = (
+        select(Captain.id, Captain.name, Captain.base, Captain.fleet,
+               func.coalesce(CaptainStats.review_count, 0).label("count"),
+               CaptainStats.avg_overall.label("avg"))
+        .outerjoin(CaptainStats, CaptainStats.captain_id == Captain.id)
+    )
+    order = [Captain.name.asc()]
+    if len(q) >= FTS_MIN_QUERY:
+        # Single FTS5 query joined on rowid; best matches first
+        phrase = '"' + q.replace('"', '""') + '"'
+        stmt = (stmt.join(captains_fts, captains_fts.c.rowid == Captain.id)
+                .where(captains_fts.c.captains_fts.match(phrase)))
+        order.insert(0, captains_fts.c.rank)
+    elif q:
+        like = f"%{q}%"
+        stmt = stmt.where(or_(
+            Captain.name.ilike(like),
+            Captain.base.ilike(like),
+            Captain.fleet.ilike(like)
+        ))
+    rows = s.execute(stmt.order_by(*order)).all()
+
+    data = [(r, r.avg if r.count >= MIN_DISPLAY_REVIEWS else None, r.count) for r in rows]
+    all_names = [r.name for r in rows]
+    return data, all_names
+
 @app.route("/", methods=["GET"])
+@cache.cached(timeout=60, query_string=True,
+              unless=lambda: session.get("authed") or "_flashes" in session)
 def index():
     # Not authed → show hero access only (no data)
     if not session.get("authed"):
@@ -177,27 +441,7 @@ def index():
 
     # Authed → search + cards
     q = (request.args.get("q", "") or "").strip()
-    with Session(engine) as s:
-        stmt = select(Captain)
-        if q:
-            like = f"%{q}%"
-            stmt = stmt.where(or_(
-                Captain.name.ilike(like),
-                Captain.base.ilike(like),
-                Captain.fleet.ilike(like)
-            ))
-        captains = s.scalars(stmt.order_by(Captain.name.asc())).all()
-
-        data = []
-        for c in captains:
-            reviews = s.scalars(select(Review).where(Review.captain_id == c.id)).all()
-            count = len(reviews)
-            avg = None
-            if count >= MIN_DISPLAY_REVIEWS:
-                avg = sum(overall_from_review(r) for r in reviews) / count
-            data.append((c, avg, count))
-
-        all_names = [c.name for c in captains]
+    data, all_names = index_cards(q)
 
     return render_template(
         "index.html",
@@ -211,7 +455,7 @@ def index():
 @app.route("/login", methods=["GET","POST"])
 def login():
     if request.method == "POST":
-        if request.form.get("code","") == INVITE_CODE:
+        if hmac.compare_digest(request.form.get("code","").encode(), INVITE_CODE_BYTES):
             session["authed"] = True
             return redirect(url_for("index"))
         flash("Invalid code.")
@@ -220,23 +464,24 @@ def login():
 @app.route("/captains/<int:cid>")
 def captain_page(cid):
     if not session.get("authed"): return redirect(url_for("index"))
-    with Session(engine) as s:
-        c = s.get(Captain, cid)
-        if not c: return "Not found", 404
-        reviews = s.scalars(select(Review).where(Review.captain_id == c.id)).all()
-        count = len(reviews)
-        cat_avgs, overall = {}, None
-        if count >= MIN_DISPLAY_REVIEWS:
-            all_keys = EVAL_KEYS + STYLE_KEYS
-            for key in all_keys:
-                vals = [getattr(r,key) for r in reviews]
-                if key == "micromanage": vals = [inv(v) for v in vals]
-                cat_avgs[key] = round(sum(vals)/len(vals), 2)
-            overall = round(sum(cat_avgs[k] for k in EVAL_KEYS)/len(EVAL_KEYS), 2)
-        last_updated = c.updated_at.date() if c.updated_at else None
-        pending_count = s.scalar(select(func.count(EditSuggestion.id)).where(
-            and_(EditSuggestion.captain_id==c.id, EditSuggestion.status=="pending")
-        ))
+    s = SessionLocal()
+    # Captain, review totals and pending-suggestion count in one round trip
+    pending_sq = select(func.count(EditSuggestion.id)).where(
+        and_(EditSuggestion.captain_id==Captain.id, EditSuggestion.status=="pending")
+    ).correlate(Captain).scalar_subquery()
+    row = s.execute(
+        select(Captain, CaptainStats, pending_sq)
+        .outerjoin(CaptainStats, CaptainStats.captain_id==Captain.id)
+        .where(Captain.id==cid)
+    ).one_or_none()
+    if not row: return "Not found", 404
+    c, st, pending_count = row
+    count = st.review_count if st else 0
+    cat_avgs, overall = {}, None
+    if count >= MIN_DISPLAY_REVIEWS:
+        cat_avgs = {k: round(v, 2) for k, v in category_avgs(st).items()}
+        overall = round(sum(cat_avgs[k] for k in EVAL_KEYS)/len(EVAL_KEYS), 2)
+    last_updated = c.updated_at.date() if c.updated_at else None
     return render_template(
         "captain.html",
         captain=c, count=count, min_display=MIN_DISPLAY_REVIEWS,
@@ -250,33 +495,48 @@ def captain_page(cid):
 @app.route("/review/new/<int:cid>", methods=["GET","POST"])
 def review_new(cid):
     if not session.get("authed"): return redirect(url_for("index"))
-    with Session(engine) as s:
-        c = s.get(Captain, cid)
-        if not c: return "Not found", 404
+    s = SessionLocal()
     token, to_set = get_or_set_reviewer_token()
     if request.method == "POST":
+        # Existence only: SELECT id rather than the full Captain row
+        if not s.scalar(select(Captain.id).where(Captain.id==cid)): return "Not found", 404
         r_hash = reviewer_hash_from_token(token)
-        twentyfour_ago = datetime.utcnow() - timedelta(hours=24)
-        with Session(engine) as s:
-            recent = s.scalars(select(Review).where(and_(
-                Review.captain_id==cid,
-                Review.reviewer_hash==r_hash,
-                Review.created_at >= twentyfour_ago
-            ))).all()
-            if recent:
-                flash("You’ve already reviewed this captain recently. Try again later.")
-                resp = redirect(url_for("captain_page", cid=cid))
-                if to_set: resp.set_cookie(REV_COOKIE, to_set, max_age=REV_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
-                return resp
-            payload = {}
-            for key in EVAL_KEYS + STYLE_KEYS:
-                v = request.form.get(key)
-                payload[key] = int(v) if v and v.isdigit() else 3
-            r = Review(captain_id=cid, reviewer_hash=r_hash, **payload)
-            s.add(r); s.commit()
+        # Missing/non-numeric/overlong answers default to 3; out-of-range values are clamped to 1..5
+        form = request.form
+        payload = {**RATING_DEFAULTS, **{k: min(5, max(1, int(v))) for k in ALL_KEYS
+                                         if len(v := form.get(k, "")) <= 2 and v.isdecimal()}}
+        # Insert only if this reviewer has no review of this captain in the last
+        # 24h: one atomic INSERT ... SELECT ... WHERE NOT EXISTS, no check-then-insert race
+        now = datetime.utcnow()
+        recent = select(Review.id).where(and_(
+            Review.captain_id==cid,
+            Review.reviewer_hash==r_hash,
+            Review.created_at >= now - timedelta(hours=24)
+        ))
+        row = {"captain_id": cid, "reviewer_hash": r_hash, "created_at": now, **payload}
+        inserted = s.execute(insert(Review).from_select(
+            list(row), select(*[literal(v) for v in row.values()]).where(~recent.exists())
+        )).rowcount
+        if not inserted:
+            flash("You’ve already reviewed this captain recently. Try again later.")
+            resp = redirect(url_for("captain_page", cid=cid))
+            if to_set: resp.set_cookie(REV_COOKIE, to_set, max_age=REV_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
+            return resp
+        # SET expressions see the pre-update row: new totals = old + payload, and
+        # avg_overall comes from those totals exactly as rebuild_captain_stats does
+        new_sums = {k: getattr(CaptainStats, f"sum_{k}") + v for k, v in payload.items()}
+        s.execute(update(CaptainStats).where(CaptainStats.captain_id==cid).values(
+            review_count=CaptainStats.review_count + 1,
+            avg_overall=stats_overall_sql(new_sums, CaptainStats.review_count + 1),
+            **{f"sum_{k}": v for k, v in new_sums.items()}
+        ))
+        s.commit()
+        cache.delete_memoized(top_rows)
         resp = redirect(url_for("captain_page", cid=cid))
         if to_set: resp.set_cookie(REV_COOKIE, to_set, max_age=REV_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
         return resp
+    c = s.get(Captain, cid)
+    if not c: return "Not found", 404
     return make_response(render_template(
         "review_new.html",
         captain=c,
@@ -291,135 +551,151 @@ def captain_new():
     if not session.get("authed"): return redirect(url_for("index"))
     if request.method == "POST":
         name = (request.form.get("name") or "").strip()
-        base = (request.form.get("base") or "").strip().upper()
-        fleet = (request.form.get("fleet") or "").strip().upper()
+        base = code_field(request.form, "base")
+        fleet = code_field(request.form, "fleet")
         if not name or base not in ALLOWED_BASES or fleet not in ALLOWED_FLEETS:
             flash("Name, Base, and Fleet are required.")
             return redirect(url_for("captain_new"))
         norm_name = " ".join(p.capitalize() for p in name.split())
-        with Session(engine) as s:
-            existing = s.scalars(select(Captain).where(and_(
-                func.lower(Captain.name)==norm_name.lower(),
-                Captain.base==base,
-                Captain.fleet==fleet
-            ))).first()
-            if existing:
-                flash("Captain already exists. Taking you to their page.")
-                return redirect(url_for("captain_page", cid=existing.id))
-            c = Captain(employee_id=new_identifier("CA"), name=norm_name, base=base, fleet=fleet)
-            s.add(c); s.flush()
-            s.add(CaptainAssignment(captain_id=c.id, base=base, fleet=fleet))
-            s.commit()
-            flash("Captain added!")
-            return redirect(url_for("captain_page", cid=c.id))
-    return render_template("captain_new.html", bases=ALLOWED_BASES, fleets=ALLOWED_FLEETS, title=f"{APP_NAME} · Add Captain")
+        s = SessionLocal()
+        existing = s.scalars(select(Captain).where(and_(
+            func.lower(Captain.name)==norm_name.lower(),
+            Captain.base==base,
+            Captain.fleet==fleet
+        ))).first()
+        if existing:
+            flash("Captain already exists. Taking you to their page.")
+            return redirect(url_for("captain_page", cid=existing.id))
+        now = datetime.utcnow()
+        c = Captain(employee_id=new_identifier("CA"), name=norm_name, base=base, fleet=fleet, updated_at=now)
+        s.add(c); s.flush()
+        s.add(CaptainAssignment(captain_id=c.id, base=base, fleet=fleet, start_date=now, changed_at=now))
+        s.add(CaptainStats(captain_id=c.id))
+        s.commit()
+        flash("Captain added!")
+        return redirect(url_for("captain_page", cid=c.id))
+    return render_template("captain_new.html", bases=ALLOWED_BASES_UI, fleets=ALLOWED_FLEETS_UI, title=f"{APP_NAME} · Add Captain")
 
 @app.route("/captain/<int:cid>/suggest", methods=["GET","POST"])
 def suggest_update(cid):
     if not session.get("authed"): return redirect(url_for("index"))
-    with Session(engine) as s:
-        c = s.get(Captain, cid)
-        if not c: return "Not found", 404
+    s = SessionLocal()
     token, to_set = get_or_set_reviewer_token()
     creator_hash = reviewer_hash_from_token(token)
     if request.method == "POST":
-        new_base = (request.form.get("base") or "").strip().upper()
-        new_fleet = (request.form.get("fleet") or "").strip().upper()
+        if not s.scalar(select(Captain.id).where(Captain.id==cid)): return "Not found", 404
+        new_base = code_field(request.form, "base")
+        new_fleet = code_field(request.form, "fleet")
         if new_base not in ALLOWED_BASES or new_fleet not in ALLOWED_FLEETS:
             flash("Select a valid base and fleet.")
             return redirect(url_for("suggest_update", cid=cid))
-        with Session(engine) as s:
-            mine = s.scalars(select(EditSuggestion).where(and_(
-                EditSuggestion.captain_id==cid,
-                EditSuggestion.creator_hash==creator_hash,
-                EditSuggestion.status=="pending"
-            ))).first()
-            if mine:
-                flash("You already have a pending suggestion for this captain.")
-                resp = redirect(url_for("suggest_update", cid=cid))
-                if to_set: resp.set_cookie(REV_COOKIE, to_set, max_age=REV_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
-                return resp
-            sug = EditSuggestion(captain_id=cid, new_base=new_base, new_fleet=new_fleet, creator_hash=creator_hash)
-            s.add(sug); s.flush()
-            since = datetime.utcnow() - timedelta(days=SUGGESTION_WINDOW_DAYS)
-            matches = s.scalars(select(EditSuggestion).where(and_(
-                EditSuggestion.captain_id==cid,
-                EditSuggestion.new_base==new_base,
-                EditSuggestion.new_fleet==new_fleet,
-                EditSuggestion.status=="pending",
-                EditSuggestion.created_at >= since
-            ))).all()
-            creators = set(m.creator_hash for m in matches)
-            if len(creators) >= CONSENSUS_THRESHOLD:
-                for m in matches:
-                    m.status = "approved"; m.resolved_at = datetime.utcnow()
-                cap = s.get(Captain, cid)
-                current = s.scalars(select(CaptainAssignment).where(and_(
-                    CaptainAssignment.captain_id==cid,
-                    CaptainAssignment.end_date.is_(None)
-                ))).first()
-                if current: current.end_date = datetime.utcnow()
-                s.add(CaptainAssignment(captain_id=cid, base=new_base, fleet=new_fleet))
-                cap.base, cap.fleet, cap.updated_at = new_base, new_fleet, datetime.utcnow()
-                s.commit()
-                flash(f"Consensus reached: Updated to {new_base} / {new_fleet}.")
-                resp = redirect(url_for("captain_page", cid=cid))
-                if to_set: resp.set_cookie(REV_COOKIE, to_set, max_age=REV_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
-                return resp
-            else:
-                s.commit()
-                flash("Suggestion recorded. When two FOs suggest the same change within 14 days, it auto-applies.")
-                resp = redirect(url_for("captain_page", cid=cid))
-                if to_set: resp.set_cookie(REV_COOKIE, to_set, max_age=REV_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
-                return resp
-    with Session(engine) as s:
-        pending = s.scalars(select(EditSuggestion).where(and_(
+        mine = s.scalar(select(EditSuggestion.id).where(and_(
             EditSuggestion.captain_id==cid,
+            EditSuggestion.creator_hash==creator_hash,
             EditSuggestion.status=="pending"
-        )).order_by(EditSuggestion.created_at.desc())).all()
+        )).limit(1))
+        if mine:
+            flash("You already have a pending suggestion for this captain.")
+            resp = redirect(url_for("suggest_update", cid=cid))
+            if to_set: resp.set_cookie(REV_COOKIE, to_set, max_age=REV_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
+            return resp
+        now = datetime.utcnow()  # one timestamp for every row this request writes
+        sug = EditSuggestion(captain_id=cid, new_base=new_base, new_fleet=new_fleet,
+                             creator_hash=creator_hash, created_at=now)
+        s.add(sug); s.flush()
+        since = now - timedelta(days=SUGGESTION_WINDOW_DAYS)
+        matching = and_(
+            EditSuggestion.captain_id==cid,
+            EditSuggestion.new_base==new_base,
+            EditSuggestion.new_fleet==new_fleet,
+            EditSuggestion.status=="pending",
+            EditSuggestion.created_at >= since
+        )
+        creators = s.scalar(select(func.count(func.distinct(EditSuggestion.creator_hash))).where(matching))
+        if creators >= CONSENSUS_THRESHOLD:
+            s.execute(update(EditSuggestion).where(matching).values(status="approved", resolved_at=now))
+            s.execute(update(CaptainAssignment).where(and_(
+                CaptainAssignment.captain_id==cid,
+                CaptainAssignment.end_date.is_(None)
+            )).values(end_date=now))
+            s.execute(insert(CaptainAssignment).values(
+                captain_id=cid, base=new_base, fleet=new_fleet, start_date=now, changed_at=now
+            ))
+            s.execute(update(Captain).where(Captain.id==cid).values(
+                base=new_base, fleet=new_fleet, updated_at=now
+            ))
+            s.commit()
+            cache.delete_memoized(top_rows)
+            flash(f"Consensus reached: Updated to {new_base} / {new_fleet}.")
+            resp = redirect(url_for("captain_page", cid=cid))
+            if to_set: resp.set_cookie(REV_COOKIE, to_set, max_age=REV_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
+            return resp
+        else:
+            s.commit()
+            flash("Suggestion recorded. When two FOs suggest the same change within 14 days, it auto-applies.")
+            resp = redirect(url_for("captain_page", cid=cid))
+            if to_set: resp.set_cookie(REV_COOKIE, to_set, max_age=REV_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
+            return resp
+    c = s.get(Captain, cid)
+    if not c: return "Not found", 404
+    # Only the columns the list shows, as plain rows
+    pending = s.execute(select(EditSuggestion.new_base, EditSuggestion.new_fleet, EditSuggestion.created_at).where(and_(
+        EditSuggestion.captain_id==cid,
+        EditSuggestion.status=="pending"
+    )).order_by(EditSuggestion.created_at.desc())).all()
     resp = make_response(render_template(
         "suggest_update.html",
-        captain=c, bases=ALLOWED_BASES, fleets=ALLOWED_FLEETS, pending=pending,
+        captain=c, bases=ALLOWED_BASES_UI, fleets=ALLOWED_FLEETS_UI, pending=pending,
         title=f"{APP_NAME} · Suggest Update"
     ))
     if to_set: resp.set_cookie(REV_COOKIE, to_set, max_age=REV_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
     return resp
 
+@cache.memoize(30)  # rankings only move on new reviews / base-fleet changes, which bust it
+def top_rows(base: str, fleet: str, min_reviews: int, top_limit: int):
+    s = SessionLocal()
+    where = []
+    if base: where.append(Captain.base == base)
+    if fleet: where.append(Captain.fleet == fleet)
+    # Rare base/fleet combos: a LIMIT 1 probe answers "nobody here" before the ranked join
+    if where and not s.scalar(select(Captain.id).where(*where).limit(1)):
+        return []
+    # Filter, threshold, rank and limit all in one query over the running totals;
+    # flat rows with just the columns the leaderboard shows, no ORM instances
+    avg = CaptainStats.avg_overall
+    stmt = (
+        select(Captain.id, Captain.name, Captain.base, Captain.fleet,
+               avg.label("avg"), CaptainStats.review_count.label("cnt"))
+        .join(CaptainStats, CaptainStats.captain_id == Captain.id)
+        .where(CaptainStats.review_count >= min_reviews, *where)
+    )
+    return s.execute(stmt.order_by(avg.desc(), CaptainStats.review_count.desc()).limit(top_limit)).all()
+
 @app.route("/top")
 def top_rated():
     if not session.get("authed"): return redirect(url_for("index"))
-    base = (request.args.get("base") or "").upper().strip()
-    fleet = (request.args.get("fleet") or "").upper().strip()
+    base = code_field(request.args, "base")
+    fleet = code_field(request.args, "fleet")
     min_reviews = MIN_DISPLAY_REVIEWS
     top_limit = 10
 
-    rows = []
-    with Session(engine) as s:
-        captains = s.scalars(select(Captain)).all()
-        for c in captains:
-            if base and c.base != base: continue
-            if fleet and c.fleet != fleet: continue
-            reviews = s.scalars(select(Review).where(Review.captain_id == c.id)).all()
-            count = len(reviews)
-            if count < min_reviews: continue
-            avg = sum(overall_from_review(r) for r in reviews)/count
-            rows.append((c, round(avg, 2), count))
-
-    rows.sort(key=lambda x: (x[1], x[2]), reverse=True)
-    rows = rows[:top_limit]
+    rows = top_rows(base, fleet, min_reviews, top_limit)
 
     return render_template(
         "top.html",
-        rows=rows, bases=ALLOWED_BASES, fleets=ALLOWED_FLEETS,
+        rows=rows, bases=ALLOWED_BASES_UI, fleets=ALLOWED_FLEETS_UI,
         sel_base=base, sel_fleet=fleet, min_reviews=min_reviews,
         title="Top Rated"
     )
 
+# Schema setup/migration on import, so `gunicorn app:app` gets a usable DB too
+bootstrap_db()
+
 # ----------------------------
 # Main (Render-friendly)
 # ----------------------------
 if __name__ == "__main__":
-    bootstrap_db()
+    warm_templates()
     port = int(os.environ.get("PORT", 5000))
     print(f"\n{APP_NAME} running on http://0.0.0.0:{port}\n")
     app.run(host="0.0.0.0", port=port, debug=False)